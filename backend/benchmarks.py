@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# benchmarks.py
+# Microbenchmarks de generación, procesado, persistencia y agregación del dashboard
+# Uso: python benchmarks.py run [--tamanos 1000 100000] [--baseline]
+#      python benchmarks.py run --tamanos 1000000 --sin-memoria   (1M es opcional y lento)
+#      python benchmarks.py compare ../datos/benchmarks/benchmark_<fecha>.json [--umbral 0.10]
+#
+# No necesita RabbitMQ: los consumidores se alimentan con los mensajes generados
+# y todos los ficheros se escriben en un directorio temporal.
+
+import os, sys, gc, json, time, random, shutil, argparse, platform, tempfile, tracemalloc, contextlib
+from datetime import datetime
+
+import productor
+import compactador
+from consumidor import ConsumidorContinente
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend"))
+import app as dashboard
+
+BENCHMARKS_DIR = os.path.join("..", "datos", "benchmarks")
+BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+# Pedidos por CSV en los casos de persistencia
+LOTE_CSV = 1000
+
+# Cada caso recibe el contexto compartido del tamaño en curso y deja en él
+# lo que necesitan los casos siguientes, por eso se ejecutan siempre en orden.
+
+def caso_generate_order(ctx):
+    random.seed(ctx['semilla'])
+    productor.fake.seed_instance(ctx['semilla'])
+    ctx['pedidos'] = [productor.generate_order(i, f"Productor_{i % 6 + 1}")[0] for i in range(ctx['n'])]
+
+def caso_json_encode(ctx):
+    ctx['cuerpos'] = [json.dumps(pedido).encode() for pedido in ctx['pedidos']]
+
+def caso_json_decode(ctx):
+    for cuerpo in ctx['cuerpos']:
+        json.loads(cuerpo.decode())
+
+def caso_procesar_pedido(ctx):
+    # Sin escritura a disco: la persistencia se mide aparte en guardar_batch
+    consumidor = ConsumidorContinente("Asia")
+    consumidor.BATCH_SIZE = ctx['n'] + 1
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        for cuerpo in ctx['cuerpos']:
+            consumidor.procesar_pedido(cuerpo)
+    ctx['procesados'] = consumidor.batch
+
+def caso_procesar_micro_batch(ctx):
+    consumidor = ConsumidorContinente("Asia", micro_batch=LOTE_CSV, retardo=0)
+    consumidor.guardar_columnas = lambda columnas, n: None
+    cuerpos = ctx['cuerpos']
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        for i in range(0, len(cuerpos), LOTE_CSV):
+            consumidor.procesar_micro_batch(cuerpos[i:i + LOTE_CSV])
+
+def limpiar_pedidos(ctx):
+    shutil.rmtree(os.path.join(ctx['base'], 'datos', 'pedidos'), ignore_errors=True)
+
+def caso_guardar_batch(ctx):
+    consumidor = ConsumidorContinente("Asia")
+    procesados = ctx['procesados']
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        for i in range(0, len(procesados), LOTE_CSV):
+            consumidor.guardar_batch(procesados[i:i + LOTE_CSV])
+
+def caso_obtener_pedidos_procesados(ctx):
+    ctx['leidos'] = dashboard.obtener_pedidos_procesados()
+
+def caso_agregacion_dashboard(ctx):
+    dashboard.contar_por_region(ctx['leidos'])
+
+def preparar_compactacion(ctx):
+    # Restaura los CSV sueltos para que cada pasada compacte lo mismo, y los deja
+    # fuera del margen de escritura del compactador
+    pedidos_dir = os.path.join(ctx['base'], 'datos', 'pedidos')
+    sueltos_dir = os.path.join(ctx['base'], 'sueltos')
+    if not os.path.exists(sueltos_dir):
+        shutil.copytree(pedidos_dir, sueltos_dir)
+    shutil.rmtree(pedidos_dir)
+    shutil.copytree(sueltos_dir, pedidos_dir)
+    for fname in os.listdir(pedidos_dir):
+        os.utime(os.path.join(pedidos_dir, fname), (0, 0))
+
+def caso_compactar(ctx):
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        compactador.compactar()
+
+def caso_obtener_pedidos_compactados(ctx):
+    dashboard.obtener_pedidos_procesados(continente="Asia")
+
+# (nombre, función medida, preparación sin medir antes de cada llamada,
+#  claves del contexto que ya no usa ningún caso posterior y se liberan al terminar)
+CASOS = [
+    ("generate_order", caso_generate_order, None, []),
+    ("json_encode", caso_json_encode, None, ['pedidos']),
+    ("json_decode", caso_json_decode, None, []),
+    ("procesar_pedido", caso_procesar_pedido, None, []),
+    ("procesar_micro_batch", caso_procesar_micro_batch, None, ['cuerpos']),
+    ("guardar_batch", caso_guardar_batch, limpiar_pedidos, ['procesados']),
+    ("obtener_pedidos_procesados", caso_obtener_pedidos_procesados, None, []),
+    ("agregacion_dashboard", caso_agregacion_dashboard, None, ['leidos']),
+    ("compactar", caso_compactar, preparar_compactacion, []),
+    ("obtener_pedidos_compactados", caso_obtener_pedidos_compactados, None, []),
+]
+
+# A partir de este tamaño cada caso se mide una vez, sin calentamiento ni tracemalloc
+TAMANO_GRANDE = 1_000_000
+# Cada muestra repite el caso hasta acumular al menos este tiempo (como timeit.autorange)
+SEGUNDOS_MUESTRA = 0.2
+# Diferencia absoluta por llamada que se considera ruido aunque supere el umbral relativo
+RUIDO_SEGUNDOS = 0.0005
+
+def muestra(funcion, preparar, ctx, minimo):
+    """Tiempo medio por llamada repitiendo el caso hasta acumular 'minimo' segundos.
+
+    Como timeit, desactiva el recolector de basura mientras se mide.
+    """
+    total, llamadas = 0.0, 0
+    while llamadas == 0 or total < minimo:
+        if preparar:
+            preparar(ctx)
+        gc.disable()
+        try:
+            inicio = time.perf_counter()
+            funcion(ctx)
+            total += time.perf_counter() - inicio
+        finally:
+            gc.enable()
+        llamadas += 1
+    return total / llamadas, llamadas
+
+def medir_caso(funcion, preparar, ctx, repeticiones, memoria, grande=False):
+    """Mejor tiempo por llamada entre varias muestras tras una pasada de calentamiento.
+
+    También guarda la mediana y la dispersión (máx - mín) de las muestras para que
+    compare distinga una regresión del ruido, y opcionalmente el pico de memoria
+    en una pasada extra.
+    """
+    if grande:
+        tiempos, llamadas = [muestra(funcion, preparar, ctx, 0)[0]], 1
+    else:
+        muestra(funcion, preparar, ctx, 0)
+        tiempos = []
+        for _ in range(repeticiones):
+            tiempo, llamadas = muestra(funcion, preparar, ctx, SEGUNDOS_MUESTRA)
+            tiempos.append(tiempo)
+    tiempos.sort()
+    resultado = {
+        "segundos": round(tiempos[0], 7),
+        "mediana": round(tiempos[len(tiempos) // 2], 7),
+        "dispersion": round(tiempos[-1] - tiempos[0], 7),
+        "muestras": len(tiempos),
+        "llamadas_por_muestra": llamadas
+    }
+
+    if memoria:
+        if preparar:
+            preparar(ctx)
+        tracemalloc.start()
+        funcion(ctx)
+        resultado["pico_memoria_kib"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return resultado
+
+def ejecutar(tamanos, repeticiones, semilla, memoria):
+    """Ejecuta todos los casos para cada tamaño en un directorio de datos temporal"""
+    resultados = {}
+    original = os.getcwd()
+    for n in tamanos:
+        with tempfile.TemporaryDirectory() as base:
+            # Consumidor y compactador escriben en ../datos; el dashboard en BASE/datos
+            os.makedirs(os.path.join(base, "backend"))
+            os.chdir(os.path.join(base, "backend"))
+            dashboard.BASE = base
+            ctx = {'n': n, 'semilla': semilla, 'base': base}
+            grande = n >= TAMANO_GRANDE
+            try:
+                for nombre, funcion, preparar, liberar in CASOS:
+                    r = medir_caso(funcion, preparar, ctx, repeticiones, memoria and not grande, grande)
+                    for clave in liberar:
+                        del ctx[clave]
+                    r.update({"caso": nombre, "n": n,
+                              "pedidos_por_segundo": round(n / r["segundos"], 1) if r["segundos"] else None})
+                    resultados[f"{nombre}@{n}"] = r
+                    memoria_txt = f" | pico {r['pico_memoria_kib']:>10.1f} KiB" if "pico_memoria_kib" in r else ""
+                    print(f"  {nombre:28} n={n:<8} {r['segundos']:9.4f}s | {r['pedidos_por_segundo'] or 0:>12.0f} pedidos/s{memoria_txt}")
+            finally:
+                os.chdir(original)
+    return resultados
+
+def comparar(base, nuevo, umbral, umbral_memoria, ruido=RUIDO_SEGUNDOS):
+    """Devuelve las regresiones de tiempo o memoria por encima del umbral relativo.
+
+    Un empeoramiento de tiempo solo cuenta si además supera el ruido absoluto y
+    la dispersión entre muestras de ambas ejecuciones. Los casos de la baseline que
+    faltan en los resultados nuevos también se devuelven.
+    """
+    regresiones = []
+    print(f"{'Caso':40} {'Base (s)':>10} {'Nuevo (s)':>10} {'Cambio':>8}")
+    for clave, anterior in base["resultados"].items():
+        if clave not in nuevo["resultados"]:
+            print(f"{clave:40} {anterior['segundos']:10.4f} {'-':>10} {'':>8} ⚠️  FALTA EN LOS RESULTADOS")
+            regresiones.append((clave, "ausente", None))
+    for clave, actual in nuevo["resultados"].items():
+        anterior = base["resultados"].get(clave)
+        if not anterior:
+            print(f"{clave:40} {'-':>10} {actual['segundos']:10.4f} {'':>8} (nuevo)")
+            continue
+        if not anterior["segundos"]:
+            continue
+        cambio = actual["segundos"] / anterior["segundos"] - 1
+        margen = max(ruido, anterior.get("dispersion", 0), actual.get("dispersion", 0))
+        marca = ""
+        if cambio > umbral and actual["segundos"] - anterior["segundos"] > margen:
+            marca = " ⚠️  REGRESIÓN"
+            regresiones.append((clave, "tiempo", cambio))
+        if anterior.get("pico_memoria_kib") and actual.get("pico_memoria_kib"):
+            cambio_memoria = actual["pico_memoria_kib"] / anterior["pico_memoria_kib"] - 1
+            if cambio_memoria > umbral_memoria:
+                marca += f" ⚠️  MEMORIA +{cambio_memoria:.0%}"
+                regresiones.append((clave, "memoria", cambio_memoria))
+        print(f"{clave:40} {anterior['segundos']:10.4f} {actual['segundos']:10.4f} {cambio:+8.1%}{marca}")
+    return regresiones
+
+def guardar_json(path, datos):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks de los caminos críticos del sistema de pedidos",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplos de uso:
+  python benchmarks.py run --baseline
+  python benchmarks.py run --tamanos 1000 100000 1000000
+  python benchmarks.py compare ../datos/benchmarks/benchmark_20261017_120000.json
+        """
+    )
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    run = sub.add_parser("run", help="Ejecuta la suite y guarda los resultados en JSON")
+    run.add_argument("--tamanos", type=int, nargs="+", default=[1000, 100000],
+                     help="Número de pedidos por ejecución (añade 1000000 explícitamente para 1M)")
+    run.add_argument("--repeticiones", type=int, default=7,
+                     help=f"Muestras por caso de al menos {SEGUNDOS_MUESTRA}s cada una (se usa la mejor)")
+    run.add_argument("--semilla", type=int, default=42, help="Semilla de random y Faker")
+    run.add_argument("--sin-memoria", action="store_true", help="No mide el pico de memoria con tracemalloc")
+    run.add_argument("--salida", help="Fichero de resultados (por defecto datos/benchmarks/benchmark_<fecha>.json)")
+    run.add_argument("--baseline", action="store_true", help="Guarda además los resultados como baseline")
+
+    cmp = sub.add_parser("compare", help="Compara unos resultados con la baseline y marca las regresiones")
+    cmp.add_argument("resultados", help="Fichero JSON generado con run")
+    cmp.add_argument("--contra", default=BASELINE, help="Baseline de referencia")
+    cmp.add_argument("--umbral", type=float, default=0.10, help="Empeoramiento de tiempo tolerado (0.10 = 10%%)")
+    cmp.add_argument("--umbral-memoria", type=float, default=0.20, help="Aumento de memoria tolerado")
+    cmp.add_argument("--ruido", type=float, default=RUIDO_SEGUNDOS,
+                     help="Diferencia absoluta por llamada (s) que se ignora como ruido")
+
+    args = parser.parse_args()
+
+    if args.comando == "run":
+        print("=" * 60)
+        print(f"⏱️  BENCHMARKS - tamaños {args.tamanos}")
+        print("=" * 60)
+        datos = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "semilla": args.semilla,
+            "resultados": ejecutar(args.tamanos, args.repeticiones, args.semilla, not args.sin_memoria)
+        }
+        salida = args.salida or os.path.join(BENCHMARKS_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        guardar_json(salida, datos)
+        print(f"📊 Resultados guardados en: {salida}")
+        if args.baseline:
+            guardar_json(BASELINE, datos)
+            print(f"📌 Baseline actualizada: {BASELINE}")
+        return
+
+    with open(args.contra, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.resultados, 'r', encoding='utf-8') as f:
+        nuevo = json.load(f)
+    regresiones = comparar(base, nuevo, args.umbral, args.umbral_memoria, args.ruido)
+    if regresiones:
+        print(f"\n❌ {len(regresiones)} regresiones detectadas")
+        sys.exit(1)
+    print("\n✅ Sin regresiones")
+
+if __name__ == "__main__":
+    main()
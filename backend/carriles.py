@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# carriles.py
+# Carriles de prioridad por importe del pedido, compartidos por productor y consumidor
+
+# (carril, cola) de mayor a menor prioridad; 'pedidos' sigue siendo la cola normal
+CARRILES = [
+    ("express", "pedidos_express"),
+    ("prioritario", "pedidos_prioritario"),
+    ("normal", "pedidos"),
+]
+
+# precio_total mínimo para entrar en cada carril
+UMBRALES_POR_DEFECTO = {"express": 5000, "prioritario": 1000}
+
+# Mensajes seguidos que puede atender un carril mientras esperan carriles inferiores
+CUOTAS_POR_DEFECTO = {"express": 8, "prioritario": 4}
+
+def clasificar(precio_total, umbrales=UMBRALES_POR_DEFECTO):
+    """Devuelve (carril, cola) para un pedido según su precio_total"""
+    for carril, cola in CARRILES:
+        if carril in umbrales and precio_total >= umbrales[carril]:
+            return carril, cola
+    return CARRILES[-1]
+
+class PlanificadorCarriles:
+    """Prioridad estricta con cupo para que los carriles inferiores no se queden sin turno.
+
+    Se atiende siempre el carril más prioritario con mensajes, salvo que ya haya
+    consumido su cuota de turnos mientras había mensajes esperando más abajo; en
+    ese caso cede un turno al siguiente carril. Servir un carril reinicia las
+    rachas de los carriles superiores.
+    """
+    def __init__(self, cuotas=CUOTAS_POR_DEFECTO):
+        self.orden = [carril for carril, _ in CARRILES]
+        self.cuotas = cuotas
+        self.rachas = dict.fromkeys(self.orden, 0)
+
+    def siguiente(self, pendientes):
+        """Elige el carril del que sacar el próximo mensaje (None si no hay ninguno)"""
+        candidatos = [carril for carril in self.orden if pendientes[carril]]
+        if not candidatos:
+            return None
+
+        elegido = candidatos[-1]
+        for carril in candidatos[:-1]:
+            if self.rachas[carril] < self.cuotas.get(carril, float('inf')):
+                elegido = carril
+                break
+
+        # La racha solo cuenta cuando hay carriles inferiores esperando
+        if elegido != candidatos[-1]:
+            self.rachas[elegido] += 1
+        for carril in self.orden[:self.orden.index(elegido)]:
+            self.rachas[carril] = 0
+        return elegido
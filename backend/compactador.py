@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# compactador.py
+# Compacta los CSV sueltos de datos/pedidos en particiones por continente y fecha
+# Uso: python compactador.py [--retencion-dias 30] [--solo-expirar]
+#
+# Estructura resultante:
+#   datos/pedidos/continent=Asia/date=2026-10-17/part-00000.csv.gz
+#   datos/pedidos/_manifest.json
+
+import os, csv, gzip, json, re, shutil, argparse, time
+from datetime import datetime, timedelta
+
+PEDIDOS_DIR = os.path.join("..", "datos", "pedidos")
+MANIFIESTO = "_manifest.json"
+PARTE = "part-00000.csv.gz"
+# Los ficheros modificados hace menos de esto pueden estar escribiéndose todavía
+MARGEN_ESCRITURA = 2.0
+# Valores de 'ID Pedido' que escribe el consumidor cuando el mensaje no trae id
+IDS_SIN_VALOR = (None, '', 'N/A')
+
+# {continent}_pedidos_{YYYYMMDD}_{HHMMSS}[_n].csv
+# Mantener sincronizado con PATRON_CSV en frontend/app.py
+PATRON_CSV = re.compile(r"^(?P<continente>[A-Za-z]+)_pedidos_(?P<fecha>\d{8})_\d{6}(?:_\d+)?\.csv$")
+
+def ruta_particion(continente, fecha):
+    """Ruta relativa de una partición dentro de datos/pedidos"""
+    return os.path.join(f"continent={continente}", f"date={fecha}")
+
+def cargar_manifiesto(pedidos_dir):
+    """Carga el manifiesto de particiones (vacío si no existe)"""
+    path = os.path.join(pedidos_dir, MANIFIESTO)
+    if not os.path.exists(path):
+        return {"actualizado": None, "particiones": {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def guardar_manifiesto(pedidos_dir, manifiesto):
+    """Escribe el manifiesto de forma atómica"""
+    manifiesto["actualizado"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    path = os.path.join(pedidos_dir, MANIFIESTO)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def leer_filas(path):
+    """Lee un CSV plano o comprimido; devuelve (cabecera, filas)"""
+    abrir = gzip.open if path.endswith('.gz') else open
+    with abrir(path, 'rt', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        return reader.fieldnames or [], list(reader)
+
+def escribir_particion(path, fieldnames, filas):
+    """Escribe una partición comprimida de forma atómica"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(filas)
+    os.replace(tmp, path)
+
+def compactar(pedidos_dir=PEDIDOS_DIR):
+    """Fusiona los CSV sueltos en sus particiones y actualiza el manifiesto.
+
+    Las filas de cada partición se ordenan de más reciente a más antigua por
+    'Fecha Procesado' y se deduplican por 'ID Pedido' (o por la fila entera
+    si no tiene ID), de modo que repetir la compactación tras un fallo a
+    mitad no duplica pedidos.
+    """
+    if not os.path.exists(pedidos_dir):
+        return 0, 0
+
+    limite = time.time() - MARGEN_ESCRITURA
+    sueltos = sorted(f for f in os.listdir(pedidos_dir)
+                     if PATRON_CSV.match(f) and os.path.getmtime(os.path.join(pedidos_dir, f)) < limite)
+    if not sueltos:
+        print("[Compactador] ℹ️  No hay ficheros sueltos que compactar")
+        return 0, 0
+
+    # Agrupar filas nuevas por (continente, fecha)
+    nuevas = {}
+    fieldnames = []
+    for fname in sueltos:
+        m = PATRON_CSV.match(fname)
+        fecha_fichero = datetime.strptime(m.group('fecha'), "%Y%m%d").strftime("%Y-%m-%d")
+        cabecera, filas = leer_filas(os.path.join(pedidos_dir, fname))
+        fieldnames += [c for c in cabecera if c not in fieldnames]
+        for fila in filas:
+            fecha = (fila.get('Fecha Procesado') or '')[:10] or fecha_fichero
+            nuevas.setdefault((m.group('continente'), fecha), []).append(fila)
+
+    manifiesto = cargar_manifiesto(pedidos_dir)
+    particiones = manifiesto["particiones"]
+
+    for (continente, fecha), filas in sorted(nuevas.items()):
+        relativa = ruta_particion(continente, fecha)
+        path = os.path.join(pedidos_dir, relativa, PARTE)
+        cabecera = list(fieldnames)
+        if os.path.exists(path):
+            previas_cabecera, previas = leer_filas(path)
+            cabecera = previas_cabecera + [c for c in cabecera if c not in previas_cabecera]
+            filas = previas + filas
+
+        unicas = {}
+        for fila in filas:
+            pedido_id = fila.get('ID Pedido')
+            # Sin ID real se deduplica por la fila completa para no fundir pedidos distintos
+            if pedido_id in IDS_SIN_VALOR:
+                pedido_id = tuple(fila.get(c) for c in cabecera)
+            unicas[pedido_id] = fila
+        ordenadas = sorted(unicas.values(),
+                           key=lambda f: (f.get('Fecha Procesado', ''), f.get('ID Pedido', '')),
+                           reverse=True)
+
+        escribir_particion(path, cabecera, ordenadas)
+        particiones[relativa] = {
+            "continente": continente,
+            "fecha": fecha,
+            "ruta": os.path.join(relativa, PARTE).replace(os.sep, '/'),
+            "filas": len(ordenadas),
+            "bytes": os.path.getsize(path),
+            "min_procesado": ordenadas[-1].get('Fecha Procesado', ''),
+            "max_procesado": ordenadas[0].get('Fecha Procesado', '')
+        }
+
+    # Solo se borran los originales cuando el manifiesto ya refleja las particiones
+    guardar_manifiesto(pedidos_dir, manifiesto)
+    for fname in sueltos:
+        os.remove(os.path.join(pedidos_dir, fname))
+
+    print(f"[Compactador] 🗜️  {len(sueltos)} ficheros compactados en {len(nuevas)} particiones")
+    return len(sueltos), len(nuevas)
+
+def expirar(retencion_dias, pedidos_dir=PEDIDOS_DIR):
+    """Elimina las particiones con fecha anterior a la política de retención"""
+    manifiesto = cargar_manifiesto(pedidos_dir)
+    limite = (datetime.now() - timedelta(days=retencion_dias)).strftime("%Y-%m-%d")
+
+    caducadas = [rel for rel, p in manifiesto["particiones"].items() if p["fecha"] < limite]
+    for relativa in caducadas:
+        path = os.path.join(pedidos_dir, relativa)
+        shutil.rmtree(path, ignore_errors=True)
+        del manifiesto["particiones"][relativa]
+        # Quitar también continent=X/ si se ha quedado vacío
+        padre = os.path.dirname(path)
+        if os.path.isdir(padre) and not os.listdir(padre):
+            os.rmdir(padre)
+
+    if caducadas:
+        guardar_manifiesto(pedidos_dir, manifiesto)
+        print(f"[Compactador] 🧹 {len(caducadas)} particiones anteriores a {limite} eliminadas")
+    return len(caducadas)
+
+def escribir_log(mensaje):
+    """Escribe en el log general del sistema"""
+    log_path = os.path.join("..", "datos", "logs", "registro.log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, 'a', encoding='utf-8') as f:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        f.write(f"[{timestamp}] Compactador: {mensaje}\n")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compactación y retención de los pedidos procesados",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplos de uso:
+  python compactador.py
+  python compactador.py --retencion-dias 30
+  python compactador.py --retencion-dias 7 --solo-expirar
+        """
+    )
+    parser.add_argument(
+        "--retencion-dias",
+        type=int,
+        default=None,
+        help="Elimina las particiones con más de N días de antigüedad"
+    )
+    parser.add_argument(
+        "--solo-expirar",
+        action="store_true",
+        help="Aplica la retención sin compactar los ficheros sueltos"
+    )
+    args = parser.parse_args()
+
+    if not args.solo_expirar:
+        ficheros, particiones = compactar()
+        if ficheros:
+            escribir_log(f"Compactados {ficheros} ficheros en {particiones} particiones")
+
+    if args.retencion_dias is not None:
+        eliminadas = expirar(args.retencion_dias)
+        if eliminadas:
+            escribir_log(f"Eliminadas {eliminadas} particiones por retención ({args.retencion_dias} días)")
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,19 @@
 # consumidor.py
 # Consumidor especializado por continente
 # Uso: python consumidor.py --continent Asia
+#      python consumidor.py --continents Asia America Europa   (un solo proceso)
+#      python consumidor.py --continent Asia --micro-batch 500 --micro-batch-ms 200
+#
+# Consume los carriles express, prioritario y normal (ver carriles.py): primero
+# los de mayor prioridad, con cuotas para que los inferiores no se queden sin turno.
 
 import pika, json, os, csv, argparse, time
+import numpy as np
+from collections import deque
+from pika.adapters.select_connection import IOLoop
 from datetime import datetime
+from perfilado import Perfilador, agregar_argumentos, desde_argumentos
+from carriles import CARRILES, CUOTAS_POR_DEFECTO, PlanificadorCarriles
 
 continente_to_port = {
     "Asia": 5672,
@@ -12,43 +22,132 @@ continente_to_port = {
     "Europa": 5674
 }
 
+# Columnas de los CSV de pedidos procesados
+FIELDNAMES = [
+    'ID Pedido', 'Productor', 'Almacén', 'Producto', 'Cantidad', 
+    'Precio Unitario', 'Precio Total', 'Cliente', 'Dirección', 
+    'Teléfono', 'Email', 'Fecha', 'Continente', 'Estado', 
+    'Fecha Procesado'
+]
+
+# Columnas copiadas del mensaje en modo micro-batch: (columna, clave JSON, valor por defecto)
+COLUMNAS_MENSAJE = [
+    ('ID Pedido', 'id', 'N/A'),
+    ('Productor', 'productor', 'N/A'),
+    ('Almacén', 'almacen', 'N/A'),
+    ('Producto', 'producto', 'N/A'),
+    ('Cantidad', 'cantidad', 0),
+    ('Precio Unitario', 'precio_unitario', 0),
+    ('Precio Total', 'precio_total', 0),
+    ('Cliente', 'cliente', 'N/A'),
+    ('Dirección', 'direccion', 'N/A'),
+    ('Teléfono', 'telefono', 'N/A'),
+    ('Email', 'email', 'N/A'),
+    ('Fecha', 'fecha', 'N/A'),
+]
+
+def _a_numeros(valores):
+    """Convierte una columna a float64; los valores no numéricos pasan a NaN"""
+    try:
+        return np.asarray(valores, dtype=np.float64)
+    except (TypeError, ValueError):
+        numeros = np.empty(len(valores), dtype=np.float64)
+        for i, valor in enumerate(valores):
+            try:
+                numeros[i] = float(valor)
+            except (TypeError, ValueError):
+                numeros[i] = np.nan
+        return numeros
+
 class ConsumidorContinente:
-    def __init__(self, continent):
+    # Mensajes sin confirmar que RabbitMQ entrega por adelantado a cada carril
+    PREFETCH = 20
+
+    def __init__(self, continent, perfilador=None, micro_batch=0, micro_batch_ms=200, retardo=0.1, cuotas=None):
         self.continent = continent
+        self.perfilador = perfilador or Perfilador(f"consumer_{continent}")
         self.port = continente_to_port[continent]
         self.pedidos_procesados = []
         self.batch = []
         self.BATCH_SIZE = 5
         self.total_procesados = 0
+        self.total_invalidos = 0
+        self.total_descartados = 0
+        self.connection = None
+        self.finalizando = False
+        # Modo micro-batch: cuerpos sin decodificar hasta N mensajes o T milisegundos
+        self.micro_batch = micro_batch
+        self.micro_batch_ms = micro_batch_ms
+        self.retardo = retardo
+        self.cuerpos = []
+        # (canal, delivery_tag, carril, enviado_ms) de los mensajes aún no escritos a disco;
+        # se confirman al escribir el micro-batch o el batch de BATCH_SIZE pedidos
+        self.confirmaciones = []
+        self._limite_micro_batch = None
+        self._temporizador = None
+        self._fecha_batch = None
+        self._secuencia_batch = 0
+        # Carriles de prioridad: mensajes recibidos pendientes y latencias por carril
+        self.planificador = PlanificadorCarriles(cuotas or CUOTAS_POR_DEFECTO)
+        self.pendientes = {carril: deque() for carril, _ in CARRILES}
+        self.latencias = {carril: deque(maxlen=1000) for carril, _ in CARRILES}
+        self.procesados_por_carril = {carril: 0 for carril, _ in CARRILES}
+        self._proximo_volcado_latencias = 0
+        self._despacho_programado = False
         
+    def prefetch(self):
+        """En micro-batch los mensajes siguen sin confirmar hasta escribirse: el prefetch debe cubrir N"""
+        return max(self.PREFETCH, self.micro_batch)
+
     def conectar_rabbitmq(self):
         """Establece conexión con RabbitMQ"""
         creds = pika.PlainCredentials('guest', 'guest')
         params = pika.ConnectionParameters('localhost', port=self.port, credentials=creds)
         self.connection = pika.BlockingConnection(params)
         self.channel = self.connection.channel()
-        self.channel.queue_declare(queue='pedidos', durable=True)
+        for _, cola in CARRILES:
+            self.channel.queue_declare(queue=cola, durable=True)
+        print(f"[Consumer-{self.continent}] ✅ Conectado a puerto {self.port}")
+
+    def conectar_asincrono(self, ioloop, al_cerrar):
+        """Abre una conexión SelectConnection sobre un ioloop compartido con otros continentes"""
+        creds = pika.PlainCredentials('guest', 'guest')
+        params = pika.ConnectionParameters('localhost', port=self.port, credentials=creds)
+        self.connection = pika.SelectConnection(
+            params,
+            on_open_callback=self._al_abrir_conexion,
+            on_open_error_callback=al_cerrar,
+            on_close_callback=al_cerrar,
+            custom_ioloop=ioloop
+        )
+
+    def _al_abrir_conexion(self, connection):
+        connection.channel(on_open_callback=self._al_abrir_canal)
+
+    def _al_abrir_canal(self, channel):
+        self.channel = channel
+        self._colas_por_declarar = len(CARRILES)
+        for _, cola in CARRILES:
+            channel.queue_declare(queue=cola, durable=True, callback=self._al_declarar_cola)
+
+    def _al_declarar_cola(self, frame):
+        self._colas_por_declarar -= 1
+        if self._colas_por_declarar == 0:
+            self.channel.basic_qos(prefetch_count=self.prefetch(), callback=self._al_configurar_qos)
+
+    def _al_configurar_qos(self, frame):
+        self.suscribir_carriles()
         print(f"[Consumer-{self.continent}] ✅ Conectado a puerto {self.port}")
+        self.escribir_log(f"Iniciado consumidor para {self.continent} (modo multicontinente)")
 
     def guardar_batch(self, pedidos):
         """Guarda un lote de pedidos en CSV"""
         if not pedidos:
             return
             
-        os.makedirs(os.path.join("..","datos","pedidos"), exist_ok=True)
-        fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
-        path = os.path.join("..","datos","pedidos", f"{self.continent}_pedidos_{fecha}.csv")
-        
-        # Definir todas las columnas posibles
-        fieldnames = [
-            'ID Pedido', 'Productor', 'Almacén', 'Producto', 'Cantidad', 
-            'Precio Unitario', 'Precio Total', 'Cliente', 'Dirección', 
-            'Teléfono', 'Email', 'Fecha', 'Continente', 'Estado', 
-            'Fecha Procesado'
-        ]
-        
+        path = self.ruta_batch()
         with open(path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
             writer.writeheader()
             writer.writerows(pedidos)
         
@@ -57,6 +156,29 @@ class ConsumidorContinente:
         # Log en archivo de registro general
         self.escribir_log(f"Procesados {len(pedidos)} pedidos - Total acumulado: {self.total_procesados}")
 
+    def ruta_batch(self):
+        """Ruta del siguiente CSV; añade un sufijo si ya hay otro del mismo segundo"""
+        os.makedirs(os.path.join("..","datos","pedidos"), exist_ok=True)
+        fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if fecha != self._fecha_batch:
+            self._fecha_batch, self._secuencia_batch = fecha, 0
+        path = os.path.join("..","datos","pedidos", f"{self.continent}_pedidos_{fecha}.csv")
+        while os.path.exists(path):
+            self._secuencia_batch += 1
+            path = os.path.join("..","datos","pedidos", f"{self.continent}_pedidos_{fecha}_{self._secuencia_batch}.csv")
+        return path
+
+    def guardar_columnas(self, columnas, n):
+        """Guarda un micro-batch en formato columnar sin construir un dict por pedido"""
+        path = self.ruta_batch()
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            writer.writerows(zip(*(columnas[campo] for campo in FIELDNAMES)))
+        
+        print(f"[Consumer-{self.continent}] 💾 Guardados {n} pedidos en {path}")
+        self.escribir_log(f"Procesados {n} pedidos - Total acumulado: {self.total_procesados}")
+
     def escribir_log(self, mensaje):
         """Escribe en el log general del sistema"""
         log_path = os.path.join("..","datos","logs","registro.log")
@@ -67,46 +189,260 @@ class ConsumidorContinente:
 
     def procesar_pedido(self, pedido_raw):
         """Procesa un pedido individual y lo añade al batch"""
+        etapa = self.perfilador.etapa
         try:
-            pedido = json.loads(pedido_raw.decode())
+            with etapa('json_decode'):
+                pedido = json.loads(pedido_raw.decode())
+            
+            with etapa('timestamp'):
+                fecha_procesado = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
             # Enriquecer el pedido con información de procesamiento
-            pedido_procesado = {
-                'ID Pedido': pedido.get('id', 'N/A'),
-                'Productor': pedido.get('productor', 'N/A'),
-                'Almacén': pedido.get('almacen', 'N/A'),
-                'Producto': pedido.get('producto', 'N/A'),
-                'Cantidad': pedido.get('cantidad', 0),
-                'Precio Unitario': pedido.get('precio_unitario', 0),
-                'Precio Total': pedido.get('precio_total', 0),
-                'Cliente': pedido.get('cliente', 'N/A'),
-                'Dirección': pedido.get('direccion', 'N/A'),
-                'Teléfono': pedido.get('telefono', 'N/A'),
-                'Email': pedido.get('email', 'N/A'),
-                'Fecha': pedido.get('fecha', 'N/A'),
-                'Continente': pedido.get('continente', self.continent),
-                'Estado': 'procesado',
-                'Fecha Procesado': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
+            with etapa('enriquecer'):
+                pedido_procesado = {
+                    'ID Pedido': pedido.get('id', 'N/A'),
+                    'Productor': pedido.get('productor', 'N/A'),
+                    'Almacén': pedido.get('almacen', 'N/A'),
+                    'Producto': pedido.get('producto', 'N/A'),
+                    'Cantidad': pedido.get('cantidad', 0),
+                    'Precio Unitario': pedido.get('precio_unitario', 0),
+                    'Precio Total': pedido.get('precio_total', 0),
+                    'Cliente': pedido.get('cliente', 'N/A'),
+                    'Dirección': pedido.get('direccion', 'N/A'),
+                    'Teléfono': pedido.get('telefono', 'N/A'),
+                    'Email': pedido.get('email', 'N/A'),
+                    'Fecha': pedido.get('fecha', 'N/A'),
+                    'Continente': pedido.get('continente', self.continent),
+                    'Estado': 'procesado',
+                    'Fecha Procesado': fecha_procesado
+                }
             
             self.batch.append(pedido_procesado)
             self.total_procesados += 1
             
-            print(f"[Consumer-{self.continent}] 📦 Procesado: {pedido.get('id')} de {pedido.get('productor', 'Unknown')} - Producto: {pedido.get('producto', 'N/A')} (€{pedido.get('precio_total', 0)})")
+            with etapa('print'):
+                print(f"[Consumer-{self.continent}] 📦 Procesado: {pedido.get('id')} de {pedido.get('productor', 'Unknown')} - Producto: {pedido.get('producto', 'N/A')} (€{pedido.get('precio_total', 0)})")
             
             # Si el batch está completo, guardarlo
             if len(self.batch) >= self.BATCH_SIZE:
-                self.guardar_batch(self.batch)
+                with etapa('guardar_batch'):
+                    self.guardar_batch(self.batch)
                 self.batch = []
                 
         except Exception as e:
             print(f"[Consumer-{self.continent}] ❌ Error procesando pedido: {e}")
 
+    def procesar_micro_batch(self, cuerpos):
+        """Decodifica y procesa un micro-batch de mensajes en una sola pasada por columnas"""
+        if not cuerpos:
+            return True
+        etapa = self.perfilador.etapa
+        try:
+            with etapa('json_decode'):
+                try:
+                    pedidos = json.loads(b'[' + b','.join(cuerpos) + b']')
+                except ValueError:
+                    pedidos = None
+                # Si el número de objetos no cuadra, algún mensaje traía varios (o
+                # ninguno) y al unirlos se perdieron los límites entre mensajes
+                if (pedidos is None or len(pedidos) != len(cuerpos)
+                        or not all(isinstance(p, dict) for p in pedidos)):
+                    pedidos = self.decodificar_uno_a_uno(cuerpos)
+            n = len(pedidos)
+            if not n:
+                return True
+            
+            with etapa('columnas'):
+                columnas = {campo: [p.get(clave, defecto) for p in pedidos]
+                            for campo, clave, defecto in COLUMNAS_MENSAJE}
+                columnas['Continente'] = [p.get('continente', self.continent) for p in pedidos]
+            
+            with etapa('timestamp'):
+                columnas['Fecha Procesado'] = [datetime.now().strftime("%Y-%m-%d %H:%M:%S")] * n
+            
+            # Validación vectorizada: cantidad positiva y precio_total == cantidad * precio_unitario
+            with etapa('validar'):
+                cantidad = _a_numeros(columnas['Cantidad'])
+                unitario = _a_numeros(columnas['Precio Unitario'])
+                total = _a_numeros(columnas['Precio Total'])
+                valido = (cantidad > 0) & np.isclose(cantidad * unitario, total)
+                columnas['Estado'] = np.where(valido, 'procesado', 'invalido').tolist()
+                invalidos = n - int(np.count_nonzero(valido))
+            
+            with etapa('guardar_batch'):
+                self.guardar_columnas(columnas, n)
+            
+            # Solo se cuenta lo escrito: si falla, los mensajes se reentregan
+            self.total_procesados += n
+            self.total_invalidos += invalidos
+            
+            with etapa('print'):
+                print(f"[Consumer-{self.continent}] 📦 Micro-batch de {n} pedidos procesado ({invalidos} inválidos)")
+            return True
+                
+        except Exception as e:
+            print(f"[Consumer-{self.continent}] ❌ Error procesando micro-batch: {e}")
+            return False
+
+    def decodificar_uno_a_uno(self, cuerpos):
+        """Decodifica cada mensaje por separado descartando (y contando) los erróneos"""
+        pedidos = []
+        for cuerpo in cuerpos:
+            try:
+                pedido = json.loads(cuerpo)
+            except ValueError as e:
+                pedido = e
+            if isinstance(pedido, dict):
+                pedidos.append(pedido)
+                continue
+            self.total_descartados += 1
+            motivo = pedido if isinstance(pedido, ValueError) else f"se esperaba un objeto JSON, llegó {type(pedido).__name__}"
+            print(f"[Consumer-{self.continent}] ❌ Error procesando pedido: {motivo}")
+        return pedidos
+
+    def acumular(self, body):
+        """Añade un mensaje sin decodificar al micro-batch y lo vacía al llegar a N o T"""
+        self.cuerpos.append(body)
+        ahora = time.monotonic()
+        if self._limite_micro_batch is None:
+            self._limite_micro_batch = ahora + self.micro_batch_ms / 1000
+            self._temporizador = self._programar(self.micro_batch_ms / 1000, self.vaciar_micro_batch)
+        if len(self.cuerpos) >= self.micro_batch or ahora >= self._limite_micro_batch:
+            self.vaciar_micro_batch()
+
+    def vaciar_micro_batch(self):
+        """Procesa los mensajes acumulados (por tamaño, por tiempo o al finalizar)"""
+        if self._temporizador is not None:
+            self._cancelar(self._temporizador)
+            self._temporizador = None
+        self._limite_micro_batch = None
+        cuerpos, self.cuerpos = self.cuerpos, []
+        confirmaciones, self.confirmaciones = self.confirmaciones, []
+        if self.procesar_micro_batch(cuerpos):
+            self.confirmar(confirmaciones)
+        else:
+            # No se ha escrito: RabbitMQ los vuelve a entregar
+            for ch, delivery_tag, _, _ in confirmaciones:
+                if ch.is_open:
+                    ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+
+    def _programar(self, segundos, funcion):
+        """Programa un temporizador en la conexión activa (bloqueante o asíncrona)"""
+        if self.connection is None:
+            return None
+        try:
+            if isinstance(self.connection, pika.BlockingConnection):
+                return self.connection.call_later(segundos, funcion)
+            return self.connection.ioloop.call_later(segundos, funcion)
+        except Exception:
+            return None
+
+    def _cancelar(self, temporizador):
+        try:
+            if isinstance(self.connection, pika.BlockingConnection):
+                self.connection.remove_timeout(temporizador)
+            else:
+                self.connection.ioloop.remove_timeout(temporizador)
+        except Exception:
+            pass
+
+    def suscribir_carriles(self):
+        """Se suscribe a la cola de cada carril; los mensajes esperan en self.pendientes"""
+        for carril, cola in CARRILES:
+            self.channel.basic_consume(
+                queue=cola,
+                on_message_callback=lambda ch, method, properties, body, carril=carril:
+                    self.recibir(carril, ch, method, properties, body)
+            )
+
+    def recibir(self, carril, ch, method, properties, body):
+        """Encola un mensaje recibido en su carril hasta que el planificador le dé turno"""
+        self.pendientes[carril].append((ch, method, properties, body))
+        if not self._despacho_programado and isinstance(self.connection, pika.SelectConnection):
+            self._despacho_programado = True
+            self.connection.ioloop.add_callback(self._despachar_asincrono)
+
+    def _despachar_asincrono(self):
+        # Un mensaje por vuelta del ioloop para que entren las entregas nuevas entre medias.
+        # El retardo simulado se espera con call_later: un sleep pararía el ioloop
+        # compartido y con él a los demás continentes.
+        self._despacho_programado = False
+        if self.despachar():
+            self._despacho_programado = True
+            self.connection.ioloop.call_later(self.retardo, self._despachar_asincrono)
+
+    def despachar(self):
+        """Procesa el siguiente mensaje según la prioridad de carriles; False si no hay ninguno"""
+        carril = self.planificador.siguiente(self.pendientes)
+        if carril is None:
+            return False
+        ch, method, properties, body = self.pendientes[carril].popleft()
+        confirmacion = (ch, method.delivery_tag, carril, (properties.headers or {}).get('enviado_ms'))
+        # Solo se confirma lo que ya está en disco (ver vaciar_micro_batch); un batch
+        # vacío tras el callback significa que se acaba de guardar o que el pedido
+        # se descartó sin nada pendiente por delante
+        self.confirmaciones.append(confirmacion)
+        self.callback(ch, method, properties, body)
+        if not self.micro_batch and not self.batch:
+            self.confirmar_pendientes()
+        
+        if time.monotonic() >= self._proximo_volcado_latencias:
+            self._proximo_volcado_latencias = time.monotonic() + 5
+            self.guardar_latencias()
+        return True
+
+    def confirmar_pendientes(self):
+        """Confirma todos los mensajes retenidos hasta ahora"""
+        confirmaciones, self.confirmaciones = self.confirmaciones, []
+        self.confirmar(confirmaciones)
+
+    def confirmar(self, confirmaciones):
+        """Confirma los mensajes a RabbitMQ y registra su latencia de cola a procesado"""
+        ahora_ms = time.time() * 1000
+        for ch, delivery_tag, carril, enviado_ms in confirmaciones:
+            # Con el canal ya cerrado RabbitMQ los reentregará (al menos una vez)
+            if not ch.is_open:
+                continue
+            ch.basic_ack(delivery_tag=delivery_tag)
+            self.procesados_por_carril[carril] += 1
+            if enviado_ms:
+                self.latencias[carril].append(ahora_ms - enviado_ms)
+
+    def guardar_latencias(self):
+        """Escribe la latencia de cola a procesado por carril en datos/stats/latencia_<continente>.json"""
+        carriles = {}
+        for carril, _ in CARRILES:
+            muestras = sorted(self.latencias[carril])
+            carriles[carril] = {
+                'procesados': self.procesados_por_carril[carril],
+                'pendientes': len(self.pendientes[carril]),
+                'media_ms': round(sum(muestras) / len(muestras), 1) if muestras else None,
+                'p50_ms': round(muestras[len(muestras) // 2], 1) if muestras else None,
+                'p95_ms': round(muestras[int(len(muestras) * 0.95)], 1) if muestras else None,
+                'max_ms': round(muestras[-1], 1) if muestras else None
+            }
+        
+        stats_dir = os.path.join("..","datos","stats")
+        os.makedirs(stats_dir, exist_ok=True)
+        path = os.path.join(stats_dir, f"latencia_{self.continent}.json")
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({
+                'continente': self.continent,
+                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'carriles': carriles
+            }, f, indent=2, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
     def callback(self, ch, method, properties, body):
         """Callback para procesar mensajes de RabbitMQ"""
-        self.procesar_pedido(body)
-        # Simular tiempo de procesamiento
-        time.sleep(0.1)
+        if self.micro_batch:
+            self.acumular(body)
+        else:
+            self.procesar_pedido(body)
+        self.perfilador.revisar()
+        # Simular tiempo de procesamiento (en modo asíncrono lo hace _despachar_asincrono)
+        if self.retardo and not isinstance(self.connection, pika.SelectConnection):
+            time.sleep(self.retardo)
 
     def iniciar_consumo(self):
         """Inicia el consumo de mensajes"""
@@ -115,15 +451,17 @@ class ConsumidorContinente:
         
         self.escribir_log(f"Iniciado consumidor para {self.continent}")
         
-        self.channel.basic_qos(prefetch_count=1)
-        self.channel.basic_consume(
-            queue='pedidos', 
-            on_message_callback=self.callback, 
-            auto_ack=True
-        )
+        self.channel.basic_qos(prefetch_count=self.prefetch())
+        self.suscribir_carriles()
         
         try:
-            self.channel.start_consuming()
+            # Recoger todas las entregas disponibles y procesar un mensaje por vuelta,
+            # así un pedido express recién llegado adelanta a los normales ya recibidos
+            while True:
+                self.connection.process_data_events(time_limit=0 if any(self.pendientes.values()) else 1)
+                if not self.despachar():
+                    # Sin mensajes: atender igualmente las señales de perfilado
+                    self.perfilador.revisar()
         except KeyboardInterrupt:
             print(f"\n[Consumer-{self.continent}] 🛑 Interrumpido por usuario")
         except Exception as e:
@@ -133,21 +471,98 @@ class ConsumidorContinente:
 
     def finalizar(self):
         """Finaliza el consumidor y guarda datos pendientes"""
+        # iniciar_consumo y main() lo llaman los dos: la segunda vez no hay nada que hacer
+        if self.finalizando:
+            return
+        self.finalizando = True
+        # Procesar el micro-batch pendiente si existe
+        if self.cuerpos:
+            print(f"[Consumer-{self.continent}] 💾 Procesando micro-batch pendiente de {len(self.cuerpos)} mensajes...")
+            self.vaciar_micro_batch()
+        
         # Guardar batch pendiente si existe
         if self.batch:
             print(f"[Consumer-{self.continent}] 💾 Guardando {len(self.batch)} pedidos pendientes...")
             self.guardar_batch(self.batch)
+            self.batch = []
+        # Todo lo retenido ya está en disco
+        self.confirmar_pendientes()
+        
+        # Volcar latencias por carril (lo que quede en self.pendientes no se
+        # confirmó y RabbitMQ lo reentregará)
+        if any(self.procesados_por_carril.values()):
+            self.guardar_latencias()
         
         # Cerrar conexión
         try:
-            if hasattr(self, 'connection') and not self.connection.is_closed:
+            if self.connection is not None and not self.connection.is_closed:
                 self.connection.close()
         except:
             pass
         
+        self.perfilador.cerrar()
+        
         print(f"[Consumer-{self.continent}] ✅ Finalizado - Total procesados: {self.total_procesados} pedidos")
         self.escribir_log(f"Finalizado - Total procesados: {self.total_procesados} pedidos")
 
+class ConsumidorMulticontinente:
+    """Consume varios continentes desde un único proceso.
+
+    Cada continente mantiene su propio ConsumidorContinente (batch, CSVs y
+    contadores) y su propia conexión; todas comparten un IOLoop de pika.
+    """
+    def __init__(self, continents, perfilador=None, **opciones):
+        self.ioloop = IOLoop()
+        self.consumidores = [ConsumidorContinente(c, perfilador, **opciones) for c in continents]
+        self.conexiones_abiertas = 0
+
+    def _al_cerrar_conexion(self, connection, motivo):
+        self.conexiones_abiertas -= 1
+        for consumidor in self.consumidores:
+            if consumidor.connection is connection and not consumidor.finalizando:
+                print(f"[Consumer-{consumidor.continent}] ❌ Conexión cerrada: {motivo!r}")
+        if self.conexiones_abiertas <= 0:
+            self.ioloop.stop()
+
+    def _revisar_perfilado(self):
+        # Atiende las señales de perfilado aunque no lleguen mensajes
+        for consumidor in self.consumidores:
+            consumidor.perfilador.revisar()
+        self.ioloop.call_later(1, self._revisar_perfilado)
+
+    def iniciar_consumo(self):
+        """Conecta todos los continentes y arranca el ioloop compartido"""
+        nombres = ", ".join(c.continent for c in self.consumidores)
+        print(f"[Consumer-Multi] 🚀 Iniciando consumo en {nombres}")
+        
+        for consumidor in self.consumidores:
+            consumidor.conectar_asincrono(self.ioloop, self._al_cerrar_conexion)
+            self.conexiones_abiertas += 1
+        self.ioloop.call_later(1, self._revisar_perfilado)
+        
+        try:
+            self.ioloop.start()
+        except KeyboardInterrupt:
+            print(f"\n[Consumer-Multi] 🛑 Interrumpido por usuario")
+        except Exception as e:
+            print(f"[Consumer-Multi] ❌ Excepción: {e}")
+        finally:
+            self.finalizar()
+
+    def finalizar(self):
+        """Guarda los batches pendientes y espera al cierre ordenado de las conexiones"""
+        for consumidor in self.consumidores:
+            consumidor.finalizar()
+        
+        if self.conexiones_abiertas > 0:
+            # Dar tiempo a que se completen los cierres, sin bloquear indefinidamente
+            self.ioloop.call_later(5, self.ioloop.stop)
+            try:
+                self.ioloop.start()
+            except Exception:
+                pass
+        self.ioloop.close()
+
 def main():
     parser = argparse.ArgumentParser(
         description="Consumidor de pedidos por continente",
@@ -157,22 +572,78 @@ Ejemplos de uso:
   python consumidor.py --continent Asia
   python consumidor.py --continent America  
   python consumidor.py --continent Europa
+  python consumidor.py --continents Asia America Europa
+  python consumidor.py --continent Asia --micro-batch 500 --retardo-simulado 0
         """
     )
-    parser.add_argument(
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument(
         "--continent", 
-        required=True, 
         choices=["Asia","America","Europa"],
         help="Continente a procesar (Asia, America, Europa)"
     )
+    grupo.add_argument(
+        "--continents",
+        nargs="+",
+        choices=["Asia","America","Europa"],
+        help="Varios continentes consumidos desde un único proceso"
+    )
+    parser.add_argument(
+        "--micro-batch",
+        type=int,
+        default=0,
+        help="Procesa los mensajes en micro-batches columnares de hasta N pedidos (0 = por mensaje)"
+    )
+    parser.add_argument(
+        "--micro-batch-ms",
+        type=int,
+        default=200,
+        help="Tiempo máximo en milisegundos que espera un micro-batch incompleto"
+    )
+    parser.add_argument(
+        "--retardo-simulado",
+        type=float,
+        default=0.1,
+        help="Segundos de procesamiento simulado por mensaje (0 para desactivarlo)"
+    )
+    parser.add_argument(
+        "--cuota-express",
+        type=int,
+        default=CUOTAS_POR_DEFECTO["express"],
+        help="Mensajes express seguidos antes de ceder un turno a carriles inferiores"
+    )
+    parser.add_argument(
+        "--cuota-prioritario",
+        type=int,
+        default=CUOTAS_POR_DEFECTO["prioritario"],
+        help="Mensajes prioritarios seguidos antes de ceder un turno al carril normal"
+    )
+    agregar_argumentos(parser)
     
     args = parser.parse_args()
+    opciones = {
+        'micro_batch': args.micro_batch,
+        'micro_batch_ms': args.micro_batch_ms,
+        'retardo': args.retardo_simulado,
+        'cuotas': {'express': args.cuota_express, 'prioritario': args.cuota_prioritario}
+    }
+    
+    if args.continents:
+        continents = list(dict.fromkeys(args.continents))
+        print("=" * 50)
+        print(f"🌍 CONSUMIDOR MULTICONTINENTE - {', '.join(c.upper() for c in continents)}")
+        print("=" * 50)
+        
+        perfilador = desde_argumentos("consumer_multi", args)
+        ConsumidorMulticontinente(continents, perfilador, **opciones).iniciar_consumo()
+        return
     
     print("=" * 50)
     print(f"🌍 CONSUMIDOR DE PEDIDOS - {args.continent.upper()}")
     print("=" * 50)
     
-    consumidor = ConsumidorContinente(args.continent)
+    perfilador = desde_argumentos(f"consumer_{args.continent}", args)
+    consumidor = ConsumidorContinente(args.continent, perfilador, **opciones)
     
     try:
         consumidor.conectar_rabbitmq()
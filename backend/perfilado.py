@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# perfilado.py
+# Instrumentación por etapas para productor y consumidor
+# Uso: python consumidor.py --continent Asia --perfilar [--captura-segundos 30]
+#      kill -USR1 <pid>  -> activa/desactiva el cronometraje por etapas
+#      kill -USR2 <pid>  -> abre una ventana de captura cProfile + tracemalloc
+
+import os, json, time, signal, threading, cProfile, pstats, io, tracemalloc
+from contextlib import nullcontext
+from datetime import datetime
+
+PERFILES_DIR = os.path.join("..", "datos", "perfiles")
+
+# Contexto compartido para cuando el perfilado está desactivado
+_ETAPA_NULA = nullcontext()
+
+class _Etapa:
+    """Cronómetro de una etapa; acumula el tiempo en el perfilador al salir"""
+    __slots__ = ("perfilador", "nombre", "inicio")
+
+    def __init__(self, perfilador, nombre):
+        self.perfilador = perfilador
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.perfilador.registrar(self.nombre, time.perf_counter_ns() - self.inicio)
+        return False
+
+class Perfilador:
+    def __init__(self, nombre, activo=False, intervalo_volcado=5.0, segundos_captura=30):
+        self.nombre = nombre
+        self.activo = activo
+        self.intervalo_volcado = intervalo_volcado
+        self.segundos_captura = segundos_captura
+        self.etapas = {}
+        self.lock = threading.Lock()
+        self.desde = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._proximo_volcado = time.monotonic() + intervalo_volcado
+        # Ventana de captura cProfile/tracemalloc
+        self._captura_hasta = None
+        self._perfil = None
+        self._hilo_captura = None
+        # Peticiones recibidas por señal; se atienden en revisar(), fuera del manejador
+        self._alternar_pendiente = False
+        self._captura_pendiente = False
+
+    def etapa(self, nombre):
+        """Devuelve un context manager que cronometra la etapa indicada"""
+        if not self.activo:
+            return _ETAPA_NULA
+        return _Etapa(self, nombre)
+
+    def registrar(self, nombre, duracion_ns):
+        """Acumula una medición (en nanosegundos) para una etapa"""
+        with self.lock:
+            stats = self.etapas.get(nombre)
+            if stats is None:
+                self.etapas[nombre] = [1, duracion_ns, duracion_ns, duracion_ns]
+            else:
+                stats[0] += 1
+                stats[1] += duracion_ns
+                if duracion_ns < stats[2]:
+                    stats[2] = duracion_ns
+                if duracion_ns > stats[3]:
+                    stats[3] = duracion_ns
+
+    def alternar(self):
+        """Activa o desactiva el cronometraje por etapas"""
+        self.activo = not self.activo
+        print(f"[Perfilado-{self.nombre}] ⏱️  Cronometraje por etapas {'activado' if self.activo else 'desactivado'}")
+        if not self.activo:
+            self.volcar_resumen()
+
+    def solicitar_captura(self, segundos=None):
+        """Abre una ventana de captura cProfile + tracemalloc"""
+        if self._captura_hasta is not None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        self._captura_hasta = time.monotonic() + (segundos or self.segundos_captura)
+        print(f"[Perfilado-{self.nombre}] 🔬 Captura abierta durante {segundos or self.segundos_captura}s")
+
+    def instalar_senales(self):
+        """SIGUSR1 alterna el cronometraje y SIGUSR2 abre una captura (solo POSIX).
+
+        Los manejadores solo marcan la petición: el manejador puede interrumpir
+        al hilo principal con self.lock tomado, así que ni bloquean ni escriben.
+        """
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self._senal_alternar)
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, self._senal_captura)
+
+    def _senal_alternar(self, signum, frame):
+        self._alternar_pendiente = True
+
+    def _senal_captura(self, signum, frame):
+        self._captura_pendiente = True
+
+    def revisar(self):
+        """Punto de control barato para el bucle caliente.
+
+        Vuelca el resumen periódicamente y abre/cierra el cProfile de la
+        ventana de captura. cProfile se activa y desactiva siempre desde el
+        mismo hilo, que es el primero que pasa por aquí con la ventana abierta.
+        """
+        if self._alternar_pendiente or self._captura_pendiente:
+            self._atender_senales()
+        if not self.activo and self._captura_hasta is None:
+            return
+        ahora = time.monotonic()
+        if self.activo and ahora >= self._proximo_volcado:
+            self._proximo_volcado = ahora + self.intervalo_volcado
+            self.volcar_resumen()
+        if self._captura_hasta is None:
+            return
+        if ahora < self._captura_hasta:
+            if self._perfil is None:
+                with self.lock:
+                    if self._perfil is not None:
+                        return
+                    self._hilo_captura = threading.get_ident()
+                    self._perfil = cProfile.Profile()
+                self._perfil.enable()
+        elif self._hilo_captura in (None, threading.get_ident()):
+            self.cerrar_captura()
+
+    def _atender_senales(self):
+        # Varios hilos pasan por revisar(): solo el que recoge la marca la atiende
+        with self.lock:
+            alternar, self._alternar_pendiente = self._alternar_pendiente, False
+            captura, self._captura_pendiente = self._captura_pendiente, False
+        if alternar:
+            self.alternar()
+        if captura:
+            self.solicitar_captura()
+
+    def cerrar_captura(self):
+        """Cierra la ventana de captura y vuelca los resultados a datos/perfiles"""
+        with self.lock:
+            if self._captura_hasta is None:
+                return
+            perfil, self._perfil = self._perfil, None
+            self._captura_hasta = None
+            self._hilo_captura = None
+
+        os.makedirs(PERFILES_DIR, exist_ok=True)
+        fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(PERFILES_DIR, f"{self.nombre}_{fecha}")
+
+        if perfil is not None:
+            perfil.disable()
+            perfil.dump_stats(f"{base}.prof")
+            salida = io.StringIO()
+            pstats.Stats(perfil, stream=salida).sort_stats("cumulative").print_stats(40)
+            with open(f"{base}_cprofile.txt", 'w', encoding='utf-8') as f:
+                f.write(salida.getvalue())
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            actual, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(f"{base}_tracemalloc.txt", 'w', encoding='utf-8') as f:
+                f.write(f"Memoria actual: {actual / 1024:.1f} KiB - Pico: {pico / 1024:.1f} KiB\n\n")
+                for stat in snapshot.statistics("lineno")[:30]:
+                    f.write(f"{stat}\n")
+
+        print(f"[Perfilado-{self.nombre}] 💾 Captura guardada en {base}*")
+
+    def resumen(self):
+        """Resumen por etapa: llamadas, tiempo total, medio, mínimo y máximo"""
+        with self.lock:
+            etapas = {nombre: list(stats) for nombre, stats in self.etapas.items()}
+        total_ns = sum(stats[1] for stats in etapas.values()) or 1
+        return {
+            "proceso": self.nombre,
+            "desde": self.desde,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "activo": self.activo,
+            "etapas": {
+                nombre: {
+                    "llamadas": n,
+                    "total_ms": round(total / 1e6, 3),
+                    "media_us": round(total / n / 1e3, 2),
+                    "min_us": round(minimo / 1e3, 2),
+                    "max_us": round(maximo / 1e3, 2),
+                    "porcentaje": round(total / total_ns * 100, 1)
+                }
+                for nombre, (n, total, minimo, maximo) in sorted(etapas.items(), key=lambda e: -e[1][1])
+            }
+        }
+
+    def volcar_resumen(self):
+        """Escribe el resumen por etapas en datos/perfiles/<nombre>_etapas.json"""
+        if not self.etapas:
+            return
+        os.makedirs(PERFILES_DIR, exist_ok=True)
+        path = os.path.join(PERFILES_DIR, f"{self.nombre}_etapas.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.resumen(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def cerrar(self):
+        """Vuelca todo lo pendiente al terminar el proceso"""
+        self.cerrar_captura()
+        self.volcar_resumen()
+
+def agregar_argumentos(parser):
+    """Añade las opciones de perfilado comunes a productor y consumidor"""
+    parser.add_argument(
+        "--perfilar",
+        action="store_true",
+        help="Activa el cronometraje por etapas desde el arranque (también con SIGUSR1)"
+    )
+    parser.add_argument(
+        "--captura-segundos",
+        type=int,
+        default=0,
+        help="Abre al arrancar una ventana cProfile + tracemalloc de N segundos (también con SIGUSR2)"
+    )
+
+def desde_argumentos(nombre, args):
+    """Crea un Perfilador configurado según los argumentos de línea de comandos"""
+    perfilador = Perfilador(nombre, activo=args.perfilar,
+                            segundos_captura=args.captura_segundos or 30)
+    perfilador.instalar_senales()
+    if args.captura_segundos:
+        perfilador.solicitar_captura(args.captura_segundos)
+    return perfilador
@@ -2,10 +2,12 @@
 # productor.py
 # 6 productores enviando 5 pedidos cada uno a colas aleatorias
 
-import pika, json, time, random, threading
+import pika, json, time, random, threading, argparse
 from faker import Faker
 from datetime import datetime
 from faker import Faker
+from perfilado import Perfilador, agregar_argumentos, desde_argumentos
+from carriles import CARRILES, UMBRALES_POR_DEFECTO, clasificar
 
 fake = Faker()
 
@@ -19,8 +21,11 @@ continente_to_port = {
 # Contador global para estadísticas
 pedidos_por_continente = {"Asia": 0, "America": 0, "Europa": 0}
 pedidos_por_productor = {f"Productor_{i+1}": {"Asia": 0, "America": 0, "Europa": 0} for i in range(6)}
+pedidos_por_carril = {carril: 0 for carril, _ in CARRILES}
 todos_los_pedidos = []  # Lista para guardar todos los pedidos generados
+umbrales = dict(UMBRALES_POR_DEFECTO)
 lock = threading.Lock()
+perfilador = Perfilador("producers")
 
 def send_to_continent(pedido, continent, producer_id):
     port = continente_to_port[continent]
@@ -28,20 +33,29 @@ def send_to_continent(pedido, continent, producer_id):
     params = pika.ConnectionParameters('localhost', port=port, credentials=creds)
     
     try:
-        conn = pika.BlockingConnection(params)
-        ch = conn.channel()
-        ch.queue_declare(queue='pedidos', durable=True)
-        ch.basic_publish(exchange='', routing_key='pedidos', body=json.dumps(pedido),
-                         properties=pika.BasicProperties(delivery_mode=2))
-        conn.close()
+        with perfilador.etapa('json_dumps'):
+            body = json.dumps(pedido)
+        # Los pedidos de mayor importe van a colas de mayor prioridad
+        carril, cola = clasificar(pedido['precio_total'], umbrales)
+        with perfilador.etapa('publish'):
+            conn = pika.BlockingConnection(params)
+            ch = conn.channel()
+            ch.queue_declare(queue=cola, durable=True)
+            ch.basic_publish(exchange='', routing_key=cola, body=body,
+                             properties=pika.BasicProperties(
+                                 delivery_mode=2,
+                                 headers={'carril': carril, 'enviado_ms': int(time.time() * 1000)}
+                             ))
+            conn.close()
         
         # Actualizar contadores
         with lock:
             pedidos_por_continente[continent] += 1
             pedidos_por_productor[producer_id][continent] += 1
+            pedidos_por_carril[carril] += 1
             todos_los_pedidos.append(pedido)
             
-        print(f"[{producer_id}] Enviado pedido {pedido['id']} -> {continent} (Producto: {pedido['producto']}, Cliente: {pedido['cliente']})")
+        print(f"[{producer_id}] Enviado pedido {pedido['id']} -> {continent}/{carril} (Producto: {pedido['producto']}, Cliente: {pedido['cliente']})")
         return True
     except Exception as e:
         print(f"[{producer_id}] Error al enviar a {continent}: {e}")
@@ -81,11 +95,13 @@ def producer_worker(producer_id):
     print(f"[{producer_id}] Iniciando - enviará 5 pedidos")
     
     for i in range(5):
-        pedido, continent = generate_order(i, producer_id)
+        with perfilador.etapa('faker'):
+            pedido, continent = generate_order(i, producer_id)
         if send_to_continent(pedido, continent, producer_id):
             print(f"[{producer_id}] ✅ Pedido {i+1}/5 enviado exitosamente")
         else:
             print(f"[{producer_id}] ❌ Error enviando pedido {i+1}/5")
+        perfilador.revisar()
         time.sleep(random.uniform(0.5, 1.5))  # Pausa aleatoria entre pedidos
     
     print(f"[{producer_id}] ✅ Terminado - 5 pedidos enviados")
@@ -99,6 +115,7 @@ def guardar_estadisticas():
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "pedidos_por_continente": pedidos_por_continente,
         "pedidos_por_productor": pedidos_por_productor,
+        "pedidos_por_carril": pedidos_por_carril,
         "total_pedidos": sum(pedidos_por_continente.values()),
         "todos_los_pedidos": todos_los_pedidos
     }
@@ -110,6 +127,26 @@ def guardar_estadisticas():
     print(f"📊 Estadísticas guardadas en: {filename}")
 
 def main():
+    global perfilador
+    parser = argparse.ArgumentParser(description="6 productores de pedidos hacia colas por continente")
+    agregar_argumentos(parser)
+    parser.add_argument(
+        "--umbral-express",
+        type=float,
+        default=UMBRALES_POR_DEFECTO["express"],
+        help="precio_total mínimo para la cola express"
+    )
+    parser.add_argument(
+        "--umbral-prioritario",
+        type=float,
+        default=UMBRALES_POR_DEFECTO["prioritario"],
+        help="precio_total mínimo para la cola prioritaria"
+    )
+    args = parser.parse_args()
+    perfilador = desde_argumentos("producers", args)
+    umbrales["express"] = args.umbral_express
+    umbrales["prioritario"] = args.umbral_prioritario
+    
     print("=== INICIANDO 6 PRODUCTORES ===")
     print("Cada productor enviará 5 pedidos a continentes aleatorios")
     print("Continentes disponibles:", continentes)
@@ -150,6 +187,10 @@ def main():
         total = sum(stats.values())
         print(f"      {prod_id:12} | {stats['Asia']:6} | {stats['America']:7} | {stats['Europa']:6} | {total:5}")
     
+    print("\n🚦 Pedidos por carril:")
+    for carril, count in pedidos_por_carril.items():
+        print(f"  {carril:11}: {count:2} pedidos")
+    
     total_global = sum(pedidos_por_continente.values())
     print(f"\n🎯 TOTAL GLOBAL: {total_global} pedidos enviados")
     print(f"⏱️  Tiempo de ejecución: {execution_time} segundos")
@@ -162,6 +203,7 @@ def main():
     
     # Guardar estadísticas
     guardar_estadisticas()
+    perfilador.cerrar()
     
     print("\n✅ PRODUCCIÓN COMPLETADA")
     print("=" * 60)
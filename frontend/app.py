@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 from flask import Flask, render_template, redirect, url_for, request, send_from_directory, flash, jsonify
-import os, subprocess, csv, time, json
+import os, subprocess, csv, time, json, signal, gzip, re, shutil
 import requests
 from requests.auth import HTTPBasicAuth
 from datetime import datetime
@@ -24,6 +24,9 @@ RABBITMQ_AMQP_PORT = {
     "Europa": 5674
 }
 
+# Días de retención de las particiones compactadas (0 = sin límite)
+RETENCION_DIAS = int(os.environ.get('TFG_RETENCION_DIAS', '0'))
+
 def pidfile(name):
     return os.path.join(RUNTIME, f"{name}.pid")
 
@@ -74,16 +77,20 @@ def stop_process(name):
     except Exception as e:
         return False, f"Error deteniendo {name}: {e}"
 
-def get_queue_info(continent):
+# Carriles de prioridad y su cola, de mayor a menor (ver backend/carriles.py)
+COLAS_CARRILES = {"express": "pedidos_express", "prioritario": "pedidos_prioritario", "normal": "pedidos"}
+CARRILES = list(COLAS_CARRILES)
+
+def get_queue_info(continent, cola='pedidos'):
     """Obtener información detallada de la cola RabbitMQ"""
     port = RABBITMQ_MANAGEMENT_PORT[continent]
     try:
-        r = requests.get(f'http://localhost:{port}/api/queues/%2F/pedidos', 
+        r = requests.get(f'http://localhost:{port}/api/queues/%2F/{cola}', 
                         auth=HTTPBasicAuth('guest','guest'), timeout=3)
         if r.status_code == 200:
             data = r.json()
             return {
-                'name': data.get('name', 'pedidos'),
+                'name': data.get('name', cola),
                 'messages': data.get('messages', 0),
                 'messages_ready': data.get('messages_ready', 0),
                 'messages_unacknowledged': data.get('messages_unacknowledged', 0),
@@ -92,10 +99,10 @@ def get_queue_info(continent):
                 'status': 'online'
             }
     except Exception as e:
-        print(f"Error obteniendo info de cola {continent}: {e}")
+        print(f"Error obteniendo info de cola {cola} en {continent}: {e}")
     
     return {
-        'name': 'pedidos', 
+        'name': cola, 
         'messages': 0, 
         'messages_ready': 0,
         'messages_unacknowledged': 0,
@@ -104,6 +111,20 @@ def get_queue_info(continent):
         'status': 'offline'
     }
 
+def get_carriles_info(continent):
+    """Información de las colas de todos los carriles: totales del continente y detalle por carril"""
+    carriles = {carril: get_queue_info(continent, cola) for carril, cola in COLAS_CARRILES.items()}
+    return {
+        'name': ', '.join(COLAS_CARRILES.values()),
+        'messages': sum(q['messages'] for q in carriles.values()),
+        'messages_ready': sum(q['messages_ready'] for q in carriles.values()),
+        'messages_unacknowledged': sum(q['messages_unacknowledged'] for q in carriles.values()),
+        # Un mismo consumidor se suscribe a todos los carriles
+        'consumers': max(q['consumers'] for q in carriles.values()),
+        'status': 'online' if any(q['status'] == 'online' for q in carriles.values()) else 'offline',
+        'carriles': carriles
+    }
+
 def cargar_estadisticas_produccion():
     """Carga las últimas estadísticas de producción"""
     stats_dir = os.path.join(BASE, 'datos', 'stats')
@@ -123,25 +144,139 @@ def cargar_estadisticas_produccion():
         print(f"Error cargando estadísticas: {e}")
         return None
 
-def obtener_pedidos_procesados():
-    """Obtiene todos los pedidos procesados de los CSVs"""
+def cargar_latencias():
+    """Carga la latencia por carril que vuelca cada consumidor en datos/stats"""
+    stats_dir = os.path.join(BASE, 'datos', 'stats')
+    latencias = {}
+    for c in CONTINENTS:
+        path = os.path.join(stats_dir, f"latencia_{c}.json")
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                latencias[c] = json.load(f)
+        except Exception as e:
+            print(f"Error cargando latencias de {c}: {e}")
+    return latencias
+
+# Ficheros sueltos que escriben los consumidores: {continent}_pedidos_{YYYYMMDD}_{HHMMSS}[_n].csv
+# Mantener sincronizado con PATRON_CSV en backend/compactador.py
+PATRON_CSV = re.compile(r"^(?P<continente>[A-Za-z]+)_pedidos_(?P<fecha>\d{8})_\d{6}(?:_\d+)?\.csv$")
+
+def cargar_manifiesto():
+    """Carga el manifiesto de particiones que mantiene el compactador"""
+    path = os.path.join(BASE, 'datos', 'pedidos', '_manifest.json')
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('particiones', {})
+    except Exception as e:
+        print(f"Error cargando manifiesto: {e}")
+        return {}
+
+def _en_rango(fecha, desde, hasta):
+    return (not desde or fecha >= desde) and (not hasta or fecha <= hasta)
+
+def obtener_pedidos_procesados(continente=None, desde=None, hasta=None):
+    """Obtiene los pedidos procesados de los CSVs sueltos y las particiones compactadas.
+
+    Las particiones se descartan por continente y fecha (YYYY-MM-DD) usando el
+    manifiesto, sin abrir los ficheros que no encajan con el filtro.
+    """
     pedidos_dir = os.path.join(BASE, 'datos', 'pedidos')
     pedidos = []
+    filtrar_fecha = bool(desde or hasta)
     
-    if os.path.exists(pedidos_dir):
-        for fname in sorted(os.listdir(pedidos_dir), reverse=True):
-            if fname.endswith('.csv'):
-                path = os.path.join(pedidos_dir, fname)
-                try:
-                    with open(path, newline='', encoding='utf-8') as f:
-                        reader = csv.DictReader(f)
-                        for row in reader:
-                            pedidos.append(row)
-                except Exception as e:
-                    print(f"Error leyendo {path}: {e}")
+    if not os.path.exists(pedidos_dir):
+        return pedidos
+    
+    # CSVs aún sin compactar (los más recientes)
+    for fname in sorted(os.listdir(pedidos_dir), reverse=True):
+        m = PATRON_CSV.match(fname)
+        if not m or (continente and m.group('continente') != continente):
+            continue
+        path = os.path.join(pedidos_dir, fname)
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    if filtrar_fecha and not _en_rango(row.get('Fecha Procesado', '')[:10], desde, hasta):
+                        continue
+                    pedidos.append(row)
+        except Exception as e:
+            print(f"Error leyendo {path}: {e}")
+    
+    # Particiones compactadas, podadas por el manifiesto
+    particiones = sorted(cargar_manifiesto().values(), key=lambda p: (p['fecha'], p['continente']), reverse=True)
+    for particion in particiones:
+        if continente and particion['continente'] != continente:
+            continue
+        if not _en_rango(particion['fecha'], desde, hasta):
+            continue
+        path = os.path.join(pedidos_dir, particion['ruta'])
+        try:
+            with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+                pedidos.extend(csv.DictReader(f))
+        except Exception as e:
+            print(f"Error leyendo {path}: {e}")
     
     return pedidos
 
+def contar_por_region(pedidos):
+    """Cuenta los pedidos procesados por continente"""
+    region_count = {"Asia": 0, "America": 0, "Europa": 0}
+    for pedido in pedidos:
+        continent = pedido.get('Continente', '')
+        if continent in region_count:
+            region_count[continent] += 1
+    return region_count
+
+def filtros_pedidos():
+    """Filtros de pedidos a partir de los parámetros de la petición"""
+    continente = request.args.get('continent')
+    return {
+        'continente': continente if continente in CONTINENTS else None,
+        'desde': request.args.get('desde') or None,
+        'hasta': request.args.get('hasta') or None
+    }
+
+def cargar_perfiles():
+    """Carga los resúmenes por etapa que vuelcan productor y consumidores"""
+    perfiles_dir = os.path.join(BASE, 'datos', 'perfiles')
+    perfiles = []
+    if not os.path.exists(perfiles_dir):
+        return perfiles
+    
+    for fname in sorted(os.listdir(perfiles_dir)):
+        if fname.endswith('_etapas.json'):
+            try:
+                with open(os.path.join(perfiles_dir, fname), 'r', encoding='utf-8') as f:
+                    perfiles.append(json.load(f))
+            except Exception as e:
+                print(f"Error cargando perfil {fname}: {e}")
+    return perfiles
+
+def listar_capturas():
+    """Lista los ficheros de captura cProfile/tracemalloc generados"""
+    perfiles_dir = os.path.join(BASE, 'datos', 'perfiles')
+    if not os.path.exists(perfiles_dir):
+        return []
+    return sorted((f for f in os.listdir(perfiles_dir) if not f.endswith('_etapas.json')), reverse=True)
+
+def enviar_senal(name, sig):
+    """Envía una señal al proceso registrado en el pidfile indicado"""
+    if not is_process_running(name):
+        return False, f"{name} no se está ejecutando"
+    
+    try:
+        with open(pidfile(name)) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, sig)
+        return True, f"Señal enviada a {name} (PID {pid})"
+    except Exception as e:
+        return False, f"Error enviando señal a {name}: {e}"
+
 @app.route('/')
 def index():
     return redirect(url_for('dashboard'))
@@ -156,19 +291,13 @@ def dashboard():
     
     # Contar totales
     total_pedidos = len(pedidos_procesados)
-    region_count = {"Asia": 0, "America": 0, "Europa": 0}
+    region_count = contar_por_region(pedidos_procesados)
     
     # Estadísticas por productor (inicializar desde stats de producción si existe)
     if stats_produccion:
         producer_stats = stats_produccion.get('pedidos_por_productor', {})
     else:
         producer_stats = {f"Productor_{i+1}": {"Asia": 0, "America": 0, "Europa": 0} for i in range(6)}
-    
-    # Contar pedidos procesados por región
-    for pedido in pedidos_procesados:
-        continent = pedido.get('Continente', '')
-        if continent in region_count:
-            region_count[continent] += 1
 
     # Estado RabbitMQ y información de colas
     rabbit_status = {}
@@ -182,12 +311,13 @@ def dashboard():
         except:
             rabbit_status[c] = False
         
-        queue_info[c] = get_queue_info(c)
+        queue_info[c] = get_carriles_info(c)
 
     # Estados de procesos
     process_status = {}
     for c in CONTINENTS:
         process_status[f"consumer_{c}"] = is_process_running(f"consumer_{c}")
+    process_status["consumer_multi"] = is_process_running("consumer_multi")
     process_status["producers"] = is_process_running("producers")
 
     # Docker containers
@@ -206,7 +336,7 @@ def dashboard():
         except Exception as e:
             logs = [f"Error leyendo logs: {e}"]
 
-    # Archivos CSV generados
+    # Archivos CSV generados (sueltos y particiones compactadas)
     csv_files = []
     pedidos_dir = os.path.join(BASE, 'datos', 'pedidos')
     if os.path.exists(pedidos_dir):
@@ -218,6 +348,8 @@ def dashboard():
                     csv_files.append({'name': fname, 'size': size_kb})
                 except:
                     csv_files.append({'name': fname, 'size': 0})
+        for particion in sorted(cargar_manifiesto().values(), key=lambda p: p['ruta']):
+            csv_files.append({'name': particion['ruta'], 'size': round(particion['bytes'] / 1024, 1)})
 
     return render_template('dashboard.html',
                            total_pedidos=total_pedidos,
@@ -231,6 +363,8 @@ def dashboard():
                            logs=logs,
                            csv_files=csv_files,
                            stats_produccion=stats_produccion,
+                           latencias=cargar_latencias(),
+                           carriles=CARRILES,
                            continents=CONTINENTS)
 
 @app.route('/start-all-producers')
@@ -257,12 +391,39 @@ def start_consumer_route():
         flash("Continente no válido", 'error')
         return redirect(url_for('dashboard'))
     
+    if is_process_running("consumer_multi"):
+        flash("Hay un consumidor multicontinente en marcha; detenlo antes de iniciar uno individual", 'error')
+        return redirect(url_for('dashboard'))
+    
     name = f"consumer_{continent}"
     cmd = ["python3", os.path.join(BASE, "backend", "consumidor.py"), "--continent", continent]
     ok, msg = start_process(name, cmd, cwd=os.path.join(BASE, 'backend'))
     flash(msg, 'success' if ok else 'error')
     return redirect(url_for('dashboard'))
 
+@app.route('/start-consumer-multi')
+def start_consumer_multi_route():
+    """Iniciar un único proceso que consume los continentes indicados (todos por defecto)"""
+    continents = [c for c in request.args.getlist('continent') if c in CONTINENTS] or CONTINENTS
+    
+    # Dos procesos sobre las mismas colas competirían por los mensajes
+    en_marcha = [c for c in continents if is_process_running(f"consumer_{c}")]
+    if en_marcha:
+        flash(f"Ya hay consumidores individuales en marcha para {', '.join(en_marcha)}; detenlos antes", 'error')
+        return redirect(url_for('dashboard'))
+    
+    name = "consumer_multi"
+    cmd = ["python3", os.path.join(BASE, "backend", "consumidor.py"), "--continents", *continents]
+    ok, msg = start_process(name, cmd, cwd=os.path.join(BASE, 'backend'))
+    flash(msg, 'success' if ok else 'error')
+    return redirect(url_for('dashboard'))
+
+@app.route('/stop-consumer-multi')
+def stop_consumer_multi_route():
+    ok, msg = stop_process("consumer_multi")
+    flash(msg, 'success' if ok else 'error')
+    return redirect(url_for('dashboard'))
+
 @app.route('/stop-consumer')
 def stop_consumer_route():
     continent = request.args.get('continent')
@@ -273,8 +434,8 @@ def stop_consumer_route():
 
 @app.route('/view-details')
 def view_details():
-    """Vista detallada con todos los pedidos procesados"""
-    pedidos = obtener_pedidos_procesados()
+    """Vista detallada con los pedidos procesados (?continent=&desde=&hasta=)"""
+    pedidos = obtener_pedidos_procesados(**filtros_pedidos())
     stats_produccion = cargar_estadisticas_produccion()
     
     return render_template('details.html', 
@@ -287,8 +448,12 @@ def view_queue():
     continent = request.args.get('continent', 'Asia')
     if continent not in CONTINENTS:
         continent = 'Asia'
+    carril = request.args.get('carril', 'normal')
+    if carril not in COLAS_CARRILES:
+        carril = 'normal'
+    cola = COLAS_CARRILES[carril]
     
-    queue_info = get_queue_info(continent)
+    queue_info = get_queue_info(continent, cola)
     
     # Obtener mensajes recientes (si RabbitMQ management lo permite)
     recent_messages = []
@@ -296,7 +461,7 @@ def view_queue():
     
     try:
         # Intentar obtener algunos mensajes de la cola
-        r = requests.get(f'http://localhost:{port}/api/queues/%2F/pedidos/get', 
+        r = requests.get(f'http://localhost:{port}/api/queues/%2F/{cola}/get', 
                         auth=HTTPBasicAuth('guest','guest'), 
                         json={"count":10,"ackmode":"ack_requeue_false","encoding":"auto"},
                         timeout=2)
@@ -314,9 +479,11 @@ def view_queue():
     
     return render_template('queue.html', 
                          continent=continent,
+                         carril=carril,
                          queue_info=queue_info,
                          messages=recent_messages,
-                         continents=CONTINENTS)
+                         continents=CONTINENTS,
+                         carriles=CARRILES)
 
 @app.route('/reset-stats')
 def reset_stats():
@@ -326,7 +493,11 @@ def reset_stats():
         pedidos_dir = os.path.join(BASE, 'datos', 'pedidos')
         if os.path.exists(pedidos_dir):
             for file in os.listdir(pedidos_dir):
-                os.remove(os.path.join(pedidos_dir, file))
+                path = os.path.join(pedidos_dir, file)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
         
         # Limpiar estadísticas
         stats_dir = os.path.join(BASE, 'datos', 'stats')
@@ -361,27 +532,24 @@ def api_queue_stats():
     """API para obtener estadísticas en tiempo real de todas las colas"""
     stats = {}
     for c in CONTINENTS:
-        stats[c] = get_queue_info(c)
+        stats[c] = get_carriles_info(c)
     
     return jsonify(stats)
 
 @app.route('/api/system_status')
 def api_system_status():
-    """API completa del estado del sistema"""
-    pedidos_procesados = obtener_pedidos_procesados()
+    """API completa del estado del sistema (?continent=&desde=&hasta=)"""
+    pedidos_procesados = obtener_pedidos_procesados(**filtros_pedidos())
     stats_produccion = cargar_estadisticas_produccion()
     
     # Contar por región
-    region_count = {"Asia": 0, "America": 0, "Europa": 0}
-    for pedido in pedidos_procesados:
-        continent = pedido.get('Continente', '')
-        if continent in region_count:
-            region_count[continent] += 1
+    region_count = contar_por_region(pedidos_procesados)
     
     # Estado de procesos
     process_status = {}
     for c in CONTINENTS:
         process_status[f"consumer_{c}"] = is_process_running(f"consumer_{c}")
+    process_status["consumer_multi"] = is_process_running("consumer_multi")
     process_status["producers"] = is_process_running("producers")
     
     # Estado RabbitMQ
@@ -394,7 +562,7 @@ def api_system_status():
             rabbit_status[c] = (r.status_code == 200)
         except:
             rabbit_status[c] = False
-        queue_info[c] = get_queue_info(c)
+        queue_info[c] = get_carriles_info(c)
     
     return jsonify({
         'timestamp': datetime.now().isoformat(),
@@ -403,10 +571,57 @@ def api_system_status():
         'process_status': process_status,
         'rabbit_status': rabbit_status,
         'queue_info': queue_info,
+        'latencias': cargar_latencias(),
         'stats_produccion': stats_produccion
     })
 
-@app.route('/csv-download/<filename>')
+@app.route('/perfilado')
+def perfilado():
+    """Resumen por etapas del productor y los consumidores"""
+    procesos = [f"consumer_{c}" for c in CONTINENTS] + ["consumer_multi", "producers"]
+    process_status = {name: is_process_running(name) for name in procesos}
+    
+    return render_template('perfilado.html',
+                           perfiles=cargar_perfiles(),
+                           capturas=listar_capturas(),
+                           process_status=process_status)
+
+@app.route('/perfilado/<accion>')
+def perfilado_accion(accion):
+    """Alterna el cronometraje (SIGUSR1) o abre una captura (SIGUSR2) en un proceso"""
+    name = request.args.get('name', '')
+    senales = {'alternar': getattr(signal, 'SIGUSR1', None), 'capturar': getattr(signal, 'SIGUSR2', None)}
+    if senales.get(accion) is None:
+        flash("Acción de perfilado no disponible", 'error')
+        return redirect(url_for('perfilado'))
+    
+    ok, msg = enviar_senal(name, senales[accion])
+    flash(msg, 'success' if ok else 'error')
+    return redirect(url_for('perfilado'))
+
+@app.route('/perfilado-download/<filename>')
+def perfilado_download(filename):
+    """Descargar una captura cProfile/tracemalloc"""
+    perfiles_dir = os.path.join(BASE, 'datos', 'perfiles')
+    return send_from_directory(perfiles_dir, filename, as_attachment=True)
+
+@app.route('/api/perfilado')
+def api_perfilado():
+    """API con los resúmenes por etapa"""
+    return jsonify(cargar_perfiles())
+
+@app.route('/compactar')
+def compactar():
+    """Compactar los CSV sueltos en particiones y aplicar la retención"""
+    name = "compactador"
+    cmd = ["python3", os.path.join(BASE, "backend", "compactador.py")]
+    if RETENCION_DIAS:
+        cmd += ["--retencion-dias", str(RETENCION_DIAS)]
+    ok, msg = start_process(name, cmd, cwd=os.path.join(BASE, 'backend'))
+    flash(msg, 'success' if ok else 'error')
+    return redirect(url_for('dashboard'))
+
+@app.route('/csv-download/<path:filename>')
 def csv_download(filename):
     """Descargar archivo CSV"""
     pedidos_dir = os.path.join(BASE, 'datos', 'pedidos')
@@ -417,6 +632,7 @@ if __name__ == "__main__":
     os.makedirs(os.path.join(BASE, 'datos', 'pedidos'), exist_ok=True)
     os.makedirs(os.path.join(BASE, 'datos', 'logs'), exist_ok=True)
     os.makedirs(os.path.join(BASE, 'datos', 'stats'), exist_ok=True)
+    os.makedirs(os.path.join(BASE, 'datos', 'perfiles'), exist_ok=True)
     
     print("🚀 Iniciando TFG Dashboard...")
     print("🌐 Accede a http://localhost:5000")